@@ -0,0 +1,304 @@
+import fcntl
+import glob
+import json
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+
+#####################
+# INSTANCE ARCHIVE:
+# Append-only replacement of the ./json/ directory, made of the files:
+#   - PATH.bin: the records, one per solved instance, written one after the other
+#   - PATH.idx: one fixed-size entry (timestamp, offset, length) per record, so record number id is at a known position
+#   - PATH.lock: taken by the writers
+#
+# A record is (rows, cols, number of solutions) followed by bit planes of rows*cols bits (bit i*cols + j is cell (i, j)):
+#   - the input points (value 1 in the grid)
+#   - the candidate points (value 2 in the grid)
+#   - one mask per solution, with the candidate points of the solution
+# (a 20x20 grid with 2 solutions takes 206 bytes instead of ~2.5KB of JSON)
+#
+# Appending writes and syncs the record before its index entry: a record only exists once its index entry is complete,
+# so an interrupted write leaves no half instance behind (bytes after the last indexed record are ignored and overwritten).
+# Lookup by id is O(1) (position in the index), lookup by timestamp is a binary search as timestamps never decrease
+# (older instances, e.g. converted from JSON, are inserted at their place by merge()).
+#####################
+
+ARCHIVE_PATH = './archive/instances'
+
+DATA_MAGIC = b'MHCDAT01'
+INDEX_MAGIC = b'MHCIDX01'
+INDEX_ENTRY = struct.Struct('<qQI')     # timestamp, offset in PATH.bin, length of the record
+RECORD_HEADER = struct.Struct('<HHH')   # rows, cols, number of solutions
+
+
+def plane_size(rows, cols):
+    return (rows * cols + 7) // 8
+
+
+def points_to_mask(points, cols):
+    mask = 0
+    for i, j in points:
+        mask |= (1 << (i * cols + j))
+    return mask
+
+
+def mask_to_points(mask, cols):
+    points = []
+    while mask:
+        k = (mask & -mask).bit_length() - 1
+        points.append((k // cols, k % cols))
+        mask &= mask - 1
+    return points
+
+
+def encode_record(rows, cols, grid, solutions):
+    size = plane_size(rows, cols)
+    input_mask = points_to_mask([(i, j) for i in range(rows) for j in range(cols) if grid[i][j] == 1], cols)
+    candidate_mask = points_to_mask([(i, j) for i in range(rows) for j in range(cols) if grid[i][j] == 2], cols)
+
+    planes = [input_mask, candidate_mask] + [points_to_mask([tuple(p) for p in solution], cols) for solution in solutions]
+    return RECORD_HEADER.pack(rows, cols, len(solutions)) + b''.join(mask.to_bytes(size, 'little') for mask in planes)
+
+
+def decode_masks(record):
+    """
+    Returns rows, cols, input mask, candidate mask and the list of solution masks of an encoded record.
+    """
+    rows, cols, nb_solutions = RECORD_HEADER.unpack_from(record)
+    size = plane_size(rows, cols)
+    masks = [int.from_bytes(record[RECORD_HEADER.size + k * size: RECORD_HEADER.size + (k + 1) * size], 'little')
+             for k in range(2 + nb_solutions)]
+    return rows, cols, masks[0], masks[1], masks[2:]
+
+
+def decode_record(record):
+    """
+    Returns the instance in the format of the old JSON files.
+    """
+    rows, cols, input_mask, candidate_mask, solution_masks = decode_masks(record)
+    grid = [[0 for _ in range(cols)] for _ in range(rows)]
+    for i, j in mask_to_points(input_mask, cols):
+        grid[i][j] = 1
+    for i, j in mask_to_points(candidate_mask, cols):
+        grid[i][j] = 2
+    return {
+        'GRID_ROWS': rows,
+        'GRID_COLS': cols,
+        'grid': grid,
+        'solutions': [mask_to_points(mask, cols) for mask in solution_masks],
+    }
+
+
+class Archive:
+    """
+    Files are opened for each operation, so an Archive can live across streamlit reruns and processes.
+    """
+
+    def __init__(self, path=ARCHIVE_PATH):
+        self.data_path = path + '.bin'
+        self.index_path = path + '.idx'
+        self.lock_path = path + '.lock'
+        os.makedirs(os.path.dirname(self.data_path) or '.', exist_ok=True)
+        with self._locked():
+            for filename, magic in ((self.data_path, DATA_MAGIC), (self.index_path, INDEX_MAGIC)):
+                with open(filename, 'ab') as f:
+                    if f.tell() == 0:
+                        f.write(magic)
+                        f.flush()
+                        os.fsync(f.fileno())
+
+    @contextmanager
+    def _locked(self):
+        # One writer at a time (a separate file, as merge() replaces the index)
+        with open(self.lock_path, 'ab') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def __len__(self):
+        # A partially written entry at the end of the index is not counted
+        return (os.path.getsize(self.index_path) - len(INDEX_MAGIC)) // INDEX_ENTRY.size
+
+    def _entry(self, f, record_id):
+        data = os.pread(f.fileno(), INDEX_ENTRY.size, len(INDEX_MAGIC) + record_id * INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack(data)
+
+    def _entries(self, f):
+        return [self._entry(f, record_id) for record_id in range(len(self))]
+
+    def append(self, rows, cols, grid, solutions, timestamp=None):
+        """
+        Appends an instance and returns its id. The timestamp (in seconds) defaults to now.
+        """
+        record = encode_record(rows, cols, grid, solutions)
+        with self._locked(), open(self.index_path, 'r+b') as index, open(self.data_path, 'r+b') as data:
+            record_id = len(self)
+            if record_id:
+                last_timestamp, last_offset, last_length = self._entry(index, record_id - 1)
+                offset = last_offset + last_length
+            else:
+                last_timestamp, offset = None, len(DATA_MAGIC)
+            if timestamp is None:
+                timestamp = int(time.time()) if last_timestamp is None else max(int(time.time()), last_timestamp)
+            elif last_timestamp is not None and timestamp < last_timestamp:
+                raise ValueError(f"timestamp={timestamp} is older than the last record of the archive ({last_timestamp}), use merge().")
+
+            # 1. Record (overwrites the leftovers of an interrupted append)
+            data.seek(offset)
+            data.write(record)
+            data.truncate()
+            data.flush()
+            os.fsync(data.fileno())
+
+            # 2. Index entry (drops a partially written entry)
+            index.seek(len(INDEX_MAGIC) + record_id * INDEX_ENTRY.size)
+            index.write(INDEX_ENTRY.pack(timestamp, offset, len(record)))
+            index.truncate()
+            index.flush()
+            os.fsync(index.fileno())
+        return record_id
+
+    def merge(self, instances):
+        """
+        Inserts instances := list of (timestamp, rows, cols, grid, solutions) at their place in chronological order
+        (after the records with the same timestamp). The ids of the records that come after them change.
+
+        All the records are rewritten at the end of PATH.bin, then a new index replaces the old one in one os.replace:
+        an interrupted merge leaves the archive as it was. The old copies of the records stay in PATH.bin as unused bytes.
+        """
+        new_records = sorted(((timestamp, encode_record(rows, cols, grid, solutions))
+                              for timestamp, rows, cols, grid, solutions in instances), key=lambda r: r[0])
+        with self._locked(), open(self.index_path, 'rb') as index, open(self.data_path, 'r+b') as data:
+            entries = self._entries(index)
+            records = [(timestamp, os.pread(data.fileno(), length, offset)) for timestamp, offset, length in entries]
+            records = sorted(records + new_records, key=lambda r: r[0])     # stable: existing records first
+
+            offset = entries[-1][1] + entries[-1][2] if entries else len(DATA_MAGIC)
+            data.seek(offset)
+            new_entries = []
+            for timestamp, record in records:
+                data.write(record)
+                new_entries.append(INDEX_ENTRY.pack(timestamp, offset, len(record)))
+                offset += len(record)
+            data.truncate()
+            data.flush()
+            os.fsync(data.fileno())
+
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'wb') as tmp:
+                tmp.write(INDEX_MAGIC + b''.join(new_entries))
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_path, self.index_path)
+
+    def get(self, record_id):
+        """
+        Returns the instance record_id (negative ids count from the end), with its id and timestamp.
+        """
+        nb_records = len(self)
+        if record_id < 0:
+            record_id += nb_records
+        if not 0 <= record_id < nb_records:
+            raise IndexError(f"No record {record_id} in the archive ({nb_records} records).")
+
+        with open(self.index_path, 'rb') as index, open(self.data_path, 'rb') as data:
+            timestamp, offset, length = self._entry(index, record_id)
+            instance = decode_record(os.pread(data.fileno(), length, offset))
+        instance['id'] = record_id
+        instance['timestamp'] = timestamp
+        return instance
+
+    def latest(self):
+        return self.get(-1) if len(self) else None
+
+    def find(self, timestamp):
+        """
+        Id of the first record with this timestamp, None if there is none.
+
+        Complexity: O(log(number of records))
+        """
+        with open(self.index_path, 'rb') as index:
+            lo, hi = 0, len(self)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._entry(index, mid)[0] < timestamp:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < len(self) and self._entry(index, lo)[0] == timestamp:
+                return lo
+        return None
+
+    def scan(self, start=0, stop=None):
+        """
+        Memory-mapped bulk read of the records start, ..., stop - 1 for analysis.
+        Yields (id, timestamp, rows, cols, input mask, candidate mask, list of solution masks), without building grids.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        with open(self.index_path, 'rb') as index, open(self.data_path, 'rb') as data, \
+             mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ) as index_map, \
+             mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) as data_map:
+            for record_id in range(start, stop):
+                timestamp, offset, length = INDEX_ENTRY.unpack_from(index_map, len(INDEX_MAGIC) + record_id * INDEX_ENTRY.size)
+                yield (record_id, timestamp) + decode_masks(data_map[offset:offset + length])
+
+
+def parse_timestamp(name):
+    """
+    Seconds since the epoch of a name in the format of time.strftime("%Y%m%d-%H%M%S") (local time).
+    """
+    return int(time.mktime(time.strptime(name, "%Y%m%d-%H%M%S")))
+
+
+def convert_json(json_dir='./json', path=ARCHIVE_PATH):
+    """
+    Adds the instances saved as JSON files in json_dir to the archive, in chronological order.
+    Files whose timestamp is already in the archive (converted before), empty or unreadable files
+    (interrupted writes) and files that are not instances (missing keys, wrong grid) are skipped.
+    """
+    archive = Archive(path)
+    files = []
+    for filename in glob.glob(os.path.join(json_dir, '*.json')):
+        try:
+            timestamp = parse_timestamp(os.path.splitext(os.path.basename(filename))[0])
+        except ValueError:
+            timestamp = int(os.path.getctime(filename))
+        files.append((timestamp, filename))
+
+    instances = []
+    for timestamp, filename in sorted(files):
+        if archive.find(timestamp) is not None:
+            print(f"Skipped {filename} (already in the archive)")
+            continue
+        try:
+            with open(filename, 'r') as f:
+                data_loaded = json.load(f)
+            instance = (timestamp, data_loaded['GRID_ROWS'], data_loaded['GRID_COLS'], data_loaded['grid'],
+                        data_loaded.get('solutions', []))
+            encode_record(*instance[1:])    # checks the grid and the solutions
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            print(f"Skipped {filename} (not a valid JSON file)")
+            continue
+        except (KeyError, TypeError, IndexError, ValueError, struct.error) as e:
+            print(f"Skipped {filename} (not an instance: {type(e).__name__}: {e})")
+            continue
+        instances.append(instance)
+
+    # Older than the archive: insert them at their place
+    latest = archive.latest()
+    if instances and latest is not None and instances[0][0] < latest['timestamp']:
+        archive.merge(instances)
+    else:
+        for instance in instances:
+            archive.append(*instance[1:], timestamp=instance[0])
+    print(f"Converted {len(instances)}/{len(files)} instances from {json_dir} to {path}")
+    return len(instances)
+
+
+if __name__ == "__main__":
+    # Convert the JSON instances: python archive.py
+    convert_json()
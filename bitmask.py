@@ -71,12 +71,14 @@ def is_valid(subset_mask, N, valid_mask, aligned_mask):
     # print("valid")
     return True
 
-def find_solutions_mask(all_points, n, max_nb_sol=10):
+def find_solutions_mask(all_points, n, max_nb_sol=10, min_size=0, max_size=None):
     """
     Finds the minimum size subset of candidates that validates all pairs in (input U subset).
+    Only the sizes in [min_size, max_size] are tried (max_size=None means m).
     """
     N = len(all_points)
     m = N - n
+    max_size = m if max_size is None else min(m, max_size)
 
     if N > 63:
         raise ValueError("N must be <= 63 for the 64-bit integer bitmask trick.")
@@ -101,7 +103,7 @@ def find_solutions_mask(all_points, n, max_nb_sol=10):
     # print(all_points)
     # print(INPUT_MASK)
     # print(CANDIDATE_INDICES)
-    for size in range(m + 1):
+    for size in range(max(0, min_size), max_size + 1):
         found_solution = False
         for subset_indices in combinations(CANDIDATE_INDICES, size):
             # Build the bitmask of the current set of points: O(size)
@@ -1,5 +1,4 @@
 from libc.stdint cimport uint64_t
-from itertools import combinations
 import numpy as np
 from libc.stdio cimport printf
 from time import time
@@ -25,6 +24,7 @@ cdef extern from "builtins.h":
 # The union is a bit operation. 
 # The connectivity testing is simply checking for every pair of points (i, j) in (subset U input) whether they are aligned, or (subset U input) contains a point in valid_mask[i, j]. 
 # So we spend O(|subset U input|) time to check connectivity, where the constant is supposedly highly optimized. 
+# The subsets (and whole branches of the enumeration) ruled out by the nogoods learned on previous failures are skipped, see NOGOODS below.
 #####################
 
 def mask_to_point(mask, all_points):
@@ -129,6 +129,164 @@ cpdef bint is_valid(uint64_t subset_mask, int N, uint64_t[:] valid_mask, uint64_
     return True
 
 
+
+cpdef int first_invalid_pair(uint64_t subset_mask, int N, uint64_t[:] valid_mask, uint64_t[:] aligned_mask):
+    """
+    Same as is_valid, but returns the first pair (i, j) of the subset that is not valid, encoded as i*N + j (-1 if all pairs are valid).
+
+    Complexity: O(N^2)
+    """
+    cdef int i, j
+    for i in range(N):
+        if not (subset_mask & (<uint64_t>1 << i)):
+            continue
+        for j in range(i + 1, N):
+            if not (subset_mask & (<uint64_t>1 << j)):
+                continue
+
+            if not is_pair_valid(i, j, subset_mask, N, valid_mask, aligned_mask):
+                return i*N + j
+
+    return -1
+
+
+#####################
+# NOGOODS:
+# When a subset fails because the pair (i, j) is not valid, we learn the nogood (trigger, require):
+#   trigger := the candidate points among i, j (0 if both are input points)
+#   require := valid_mask[i*N + j], the points in the rectangle span by i and j
+# Any subset containing trigger and no point of require fails for the same reason.
+# During the enumeration, a partial subset (chosen so far + candidates that can still be added) is pruned
+# as soon as it contains the trigger of a nogood and can no longer get a point of its require.
+# The table is shared by all the sizes of one search, so the failures of one size prune the next ones.
+#####################
+
+cdef enum:
+    NOGOOD_TABLE_SIZE = 64      # Bounded: every subset is tested against the table
+
+
+cdef class NogoodTable:
+    cdef uint64_t trigger[NOGOOD_TABLE_SIZE]
+    cdef uint64_t require[NOGOOD_TABLE_SIZE]
+    cdef unsigned int hits[NOGOOD_TABLE_SIZE]
+    cdef public int size
+    cdef public long nb_pruned
+    cdef int nb_learned
+
+    def __cinit__(self):
+        self.size = 0
+        self.nb_pruned = 0
+        self.nb_learned = 0
+
+    cdef bint prunes(self, uint64_t chosen, uint64_t future):
+        """
+        Whether a nogood rules out every subset containing chosen and contained in (chosen | future).
+        """
+        cdef int k
+        cdef uint64_t t, r
+        cdef unsigned int h
+        for k in range(self.size):
+            if (chosen & self.trigger[k]) == self.trigger[k] and not ((chosen | future) & self.require[k]):
+                self.hits[k] += 1
+                self.nb_pruned += 1
+                # Move the nogood one step towards the front: the useful ones end up tested first
+                if k > 0:
+                    t, r, h = self.trigger[k], self.require[k], self.hits[k]
+                    self.trigger[k], self.require[k], self.hits[k] = self.trigger[k-1], self.require[k-1], self.hits[k-1]
+                    self.trigger[k-1], self.require[k-1], self.hits[k-1] = t, r, h
+                return True
+        return False
+
+    cdef void learn(self, uint64_t trigger, uint64_t require):
+        cdef int k
+        cdef int evicted = self.size
+        if self.size == NOGOOD_TABLE_SIZE:
+            # Evict the least used nogood, the one closest to the back on ties (the front holds the recently useful ones)
+            evicted = 0
+            for k in range(NOGOOD_TABLE_SIZE):
+                if self.hits[k] <= self.hits[evicted]:
+                    evicted = k
+            # Halve the hits once every NOGOOD_TABLE_SIZE learns, so that old nogoods don't stay forever
+            self.nb_learned += 1
+            if self.nb_learned == NOGOOD_TABLE_SIZE:
+                self.nb_learned = 0
+                for k in range(NOGOOD_TABLE_SIZE):
+                    self.hits[k] >>= 1
+        else:
+            self.size += 1
+        self.trigger[evicted] = trigger
+        self.require[evicted] = require
+        self.hits[evicted] = 0
+
+
+cdef class SizeSearch:
+    """
+    Enumerates the subsets of candidates of a given size in the order of itertools.combinations (DFS over the candidate indices),
+    skipping the branches ruled out by the nogoods.
+    """
+    cdef int N
+    cdef uint64_t INPUT_MASK
+    cdef uint64_t[:] valid_mask
+    cdef uint64_t[:] aligned_mask
+    cdef NogoodTable nogoods
+    cdef uint64_t[:] solutions_mask
+    cdef int max_nb_sol
+    cdef int count_solutions
+
+    def __cinit__(self, int N, uint64_t INPUT_MASK, uint64_t[:] valid_mask, uint64_t[:] aligned_mask, NogoodTable nogoods):
+        self.N = N
+        self.INPUT_MASK = INPUT_MASK
+        self.valid_mask = valid_mask
+        self.aligned_mask = aligned_mask
+        self.nogoods = nogoods
+
+    cdef int run(self, int n, int size, uint64_t[:] solutions_mask, int max_nb_sol):
+        """
+        Stores in solutions_mask the (at most max_nb_sol) subsets of candidates of the given size that are solutions,
+        and returns how many were found.
+        """
+        self.solutions_mask = solutions_mask
+        self.max_nb_sol = max_nb_sol
+        self.count_solutions = 0
+        self.extend(n, size, 0)
+        return self.count_solutions
+
+    cdef bint extend(self, int start, int remaining, uint64_t chosen):
+        """
+        Tries every way to add `remaining` candidates with index >= start to chosen. Returns True to stop the enumeration.
+        """
+        cdef int c
+        cdef uint64_t new_chosen, future
+
+        if remaining == 0:
+            return self.test(chosen)
+
+        for c in range(start, self.N - remaining + 1):
+            new_chosen = chosen | (<uint64_t>1 << c)
+            # Candidates that can still be added after c
+            future = (~<uint64_t>0 << (c + 1)) if c < 63 else 0
+            if remaining > 1 and self.nogoods.prunes(new_chosen, future):
+                continue
+            if self.extend(c + 1, remaining - 1, new_chosen):
+                return True
+        return False
+
+    cdef bint test(self, uint64_t chosen):
+        cdef int pair, i, j
+        if self.nogoods.prunes(chosen, 0):
+            return False
+
+        pair = first_invalid_pair(self.INPUT_MASK | chosen, self.N, self.valid_mask, self.aligned_mask)
+        if pair >= 0:
+            i, j = pair // self.N, pair % self.N
+            self.nogoods.learn(((<uint64_t>1 << i) | (<uint64_t>1 << j)) & ~self.INPUT_MASK, self.valid_mask[pair])
+            return False
+
+        self.solutions_mask[self.count_solutions] = chosen
+        self.count_solutions += 1
+        return self.count_solutions == self.max_nb_sol
+
+
 # Change in argument: all_points contains all the points and we simply indicate the index n of the first candidate point in the list
 cpdef tuple find_solutions(list all_points, int n, int max_nb_sol=3, int min_size=0, int max_size=0):
     """
@@ -147,52 +305,37 @@ cpdef tuple find_solutions(list all_points, int n, int max_nb_sol=3, int min_siz
 
     # First n bits indicate the input points, bits n+1, ..., N are the candidate points
     cdef uint64_t INPUT_MASK = (<uint64_t>1 << n) - 1 
-    cdef range CANDIDATE_INDICES = range(n, N)
 
     # Sanity check
     # if is_valid(INPUT_MASK, N, valid_mask, aligned_mask):
     #     return True, []
 
     cdef int size
-    cdef tuple subset_indices
-    cdef bint found_solution = 0
     # One solution is encoded as a uint64_t integer, we will store at most max_nb_sol solutions
     cdef uint64_t[:] solutions_mask = np.zeros(max_nb_sol, dtype=np.uint64) 
     cdef int count_solutions = 0
-    cdef uint64_t SUBSET_MASK
-    cdef uint64_t POINTS_MASK
-    cdef int i
     cdef int t1
     cdef int t2
+    cdef long nb_pruned     # nogoods.nb_pruned at the start of the current size
+
+    # Nogoods learned on one size are used to prune the next ones
+    cdef NogoodTable nogoods = NogoodTable()
+    cdef SizeSearch search = SizeSearch(N, INPUT_MASK, valid_mask, aligned_mask, nogoods)
 
     # Enumerate subsets of candidate in increasing size until found connected subset
     for size in range(min_size, max_size + 1):
         print("Testing size", size)
         t1 = time()
-        for subset_indices in combinations(CANDIDATE_INDICES, size):
-            # Build the bitmask of the current set of points: O(size)
-            SUBSET_MASK = 0
-            for i in subset_indices:
-                SUBSET_MASK |= (<uint64_t>1 << i)
-            POINTS_MASK = INPUT_MASK | SUBSET_MASK
-
-            # Test connectivity
-            if is_valid(POINTS_MASK, N, valid_mask, aligned_mask):
-                solutions_mask[count_solutions] = SUBSET_MASK
-                count_solutions += 1
-                found_solution = 1
-                if count_solutions == max_nb_sol:
-                    t2 = time()
-                    print(f"Found {count_solutions} solutions ({t2-t1} sec)")
-                    return True, masks_to_points(solutions_mask, all_points)
+        nb_pruned = nogoods.nb_pruned
+        count_solutions = search.run(n, size, solutions_mask, max_nb_sol)
         
-        if found_solution:
+        if count_solutions:
             t2 = time()
             print(f"Found {count_solutions} solutions ({t2-t1} sec)")
             return True, masks_to_points(solutions_mask, all_points)
         
         t2 = time()
-        print(f"Not found ({t2-t1} sec)")
+        print(f"Not found ({t2-t1} sec, {nogoods.nb_pruned - nb_pruned} pruned by nogoods)")
             
     return False, []
 
@@ -216,20 +359,21 @@ cpdef tuple find_solutions_reverse(list all_points, int n, int max_nb_sol=3, int
 
     # First n bits indicate the input points, bits n+1, ..., N are the candidate points
     cdef uint64_t INPUT_MASK = (<uint64_t>1 << n) - 1 
-    cdef range CANDIDATE_INDICES = range(n, N)
 
     cdef int size
-    cdef tuple subset_indices
     cdef bint found_solution
     # One solution is encoded as a uint64_t integer, we will store at most max_nb_sol solutions
     cdef uint64_t[:] solutions_mask = np.zeros(max_nb_sol, dtype=np.uint64) 
+    cdef uint64_t[:] size_solutions_mask
     cdef int count_solutions
     cdef int prev_count_solutions = 0
-    cdef uint64_t SUBSET_MASK
-    cdef uint64_t POINTS_MASK
-    cdef int i
     cdef int t1
     cdef int t2
+    cdef long nb_pruned     # nogoods.nb_pruned at the start of the current size
+
+    # Nogoods learned on one size are used to prune the next ones
+    cdef NogoodTable nogoods = NogoodTable()
+    cdef SizeSearch search = SizeSearch(N, INPUT_MASK, valid_mask, aligned_mask, nogoods)
 
 
     # targets = logging.StreamHandler(sys.stdout), logging.FileHandler(f'./log/{filename}.log')
@@ -239,39 +383,23 @@ cpdef tuple find_solutions_reverse(list all_points, int n, int max_nb_sol=3, int
     # Enumerate subsets of candidate in decreasing size until found connected subset
     for size in range(max_size, min_size-1, -1):
         
-        # (re)initialize number of solutions found for the current size
-        found_solution = 0
-        count_solutions = 0 
-        
         # logging.info("Testing size", size)
         print("Testing size", size)
         t1 = time()
-        for subset_indices in combinations(CANDIDATE_INDICES, size):
-            # Build the bitmask of the current set of points: O(size)
-            SUBSET_MASK = 0
-            for i in subset_indices:
-                SUBSET_MASK |= (<uint64_t>1 << i)
-            POINTS_MASK = INPUT_MASK | SUBSET_MASK
-
-            # Test connectivity
-            if is_valid(POINTS_MASK, N, valid_mask, aligned_mask):
-                
-                # If this is the first solution found for current size: reinitialize everything
-                if not found_solution:
-                    found_solution = 1
-                    solutions_mask = np.zeros(max_nb_sol, dtype=np.uint64)
-
-                # Store solution
-                solutions_mask[count_solutions] = SUBSET_MASK
-                count_solutions += 1
-
-                # If found max_nb_solution, move on to the next size 
-                if count_solutions == max_nb_sol:
-                    t2 = time()
-                    # logging.info(f"Found {count_solutions} solutions ({t2-t1} sec)")
-                    print(f"Found {count_solutions} solutions ({t2-t1} sec)")
-                    prev_count_solutions = count_solutions
-                    break
+        nb_pruned = nogoods.nb_pruned
+        # Solutions of the current size, they replace the stored ones only if there is at least one
+        size_solutions_mask = np.zeros(max_nb_sol, dtype=np.uint64)
+        count_solutions = search.run(n, size, size_solutions_mask, max_nb_sol)
+        found_solution = count_solutions > 0
+        if found_solution:
+            solutions_mask = size_solutions_mask
+
+        # If found max_nb_solution, move on to the next size 
+        if count_solutions == max_nb_sol:
+            t2 = time()
+            # logging.info(f"Found {count_solutions} solutions ({t2-t1} sec)")
+            print(f"Found {count_solutions} solutions ({t2-t1} sec)")
+            prev_count_solutions = count_solutions
 
 
         # If didn't find solution in current size but in previous size, 
@@ -280,7 +408,7 @@ cpdef tuple find_solutions_reverse(list all_points, int n, int max_nb_sol=3, int
         if not found_solution and prev_count_solutions > 0:
             t2 = time()
             # logging.info(f"Not found in {t2-t1} sec")
-            print(f"Not found in {t2-t1} sec")
+            print(f"Not found in {t2-t1} sec ({nogoods.nb_pruned - nb_pruned} pruned by nogoods)")
             return True, masks_to_points(solutions_mask, all_points)
         
         if found_solution and count_solutions < max_nb_sol:
@@ -0,0 +1,286 @@
+import json
+import os
+import time
+from math import comb
+from statistics import median
+from setmask import find_solutions as find_solutions_set
+from bitmask import find_solutions_mask
+
+try:
+    from bitmask_cy import find_solutions as find_solutions_cy, find_solutions_reverse as find_solutions_reverse_cy
+except ImportError:     # Cython extension not compiled (run ./build_and_test.sh)
+    find_solutions_cy = find_solutions_reverse_cy = None
+
+#####################
+# ENGINE DISPATCH:
+# We have three engines (setmask, bitmask, bitmask_cy) and two directions (increasing / decreasing size).
+# A plan is a pair (engine, direction). For a given instance we:
+#   - compute cheap features: N, m, density of the points in their bounding box, and an estimate s of the solution size
+#   - estimate the work of every eligible plan as the number of subsets it enumerates given s
+#   - multiply the work by the seconds per modelled subset of the plan, learned from the past runs recorded in BENCH_FILE
+#     on the instances most similar to the current one (default rates when nothing is recorded yet)
+# and run the plan with the smallest predicted time, or refuse the instance if even that time is over TIME_LIMIT.
+# To learn the rates of every plan, a plan with fewer than NB_NEIGHBOURS recorded runs is run instead
+# when its predicted time is at most EXPLORE_FACTOR times the best one.
+#####################
+
+BENCH_FILE = './bench/dispatch.jsonl'
+NB_NEIGHBOURS = 5       # number of similar recorded runs used to learn the rate of a plan
+MIN_RUN_TIME = 0.002    # shorter runs are dominated by the precomputation and are not used to learn the rates
+EXPLORE_FACTOR = 4      # how much slower (predicted) a plan with few recorded runs can be and still be tried
+TIME_LIMIT = 60         # seconds: instances predicted to take longer are refused instead of blocking the caller
+BENCH_TIME_LIMIT = 10   # seconds: plans predicted to take longer are skipped by benchmark()
+
+# Seconds per modelled subset (see estimate_work), median over random 8x8 instances with N=24 (used until runs are recorded).
+# The model counts the subsets of a plain enumeration, while bitmask_cy skips most of them with its nogoods:
+# its rates are much smaller, and depend on the instance more than on N and m, hence the rates learned on similar instances.
+DEFAULT_RATES = {
+    ("setmask", "increasing"): 1.5e-3,
+    ("bitmask", "increasing"): 1.5e-3,
+    ("bitmask_cy", "increasing"): 3e-6,
+    ("bitmask_cy", "decreasing"): 1e-6,
+}
+
+_bench_records = None   # lazily loaded content of BENCH_FILE
+
+
+def instance_features(all_points, n):
+    """
+    N           := number of points
+    m           := number of candidate points
+    density     := N / area of the bounding box of all the points
+    estimate    := estimate of the solution size (see estimate_size), None if there is no solution
+
+    Complexity: O(n^2 m)
+    """
+    N = len(all_points)
+    if N:
+        xs = [p[0] for p in all_points]
+        ys = [p[1] for p in all_points]
+        density = N / ((max(xs) - min(xs) + 1) * (max(ys) - min(ys) + 1))
+    else:
+        density = 0.0
+    return {"N": N, "m": N - n, "density": density, "estimate": estimate_size(all_points, n)}
+
+
+def estimate_size(all_points, n):
+    """
+    Cheap estimate of the solution size: greedy cover of the input pairs that are not connected,
+    where a candidate covers a pair if it lies in the rectangle span by the pair.
+    It ignores the new pairs created by the chosen candidates, so it is usually an underestimate.
+
+    Returns None if some input pair has no candidate in its rectangle: then no subset can connect the input.
+
+    Complexity: O(n^2 m)
+    """
+    uncovered = []      # for each unresolved input pair, the set of candidate indices in its rectangle
+    for i in range(n):
+        ax, ay = all_points[i][0], all_points[i][1]
+        for j in range(i + 1, n):
+            bx, by = all_points[j][0], all_points[j][1]
+            if ax == bx or ay == by:
+                continue
+            xmin, xmax = min(ax, bx), max(ax, bx)
+            ymin, ymax = min(ay, by), max(ay, by)
+
+            inside = {k for k in range(len(all_points)) if k != i and k != j
+                      and xmin <= all_points[k][0] <= xmax and ymin <= all_points[k][1] <= ymax}
+            if any(k < n for k in inside):      # an input point already connects the pair
+                continue
+            if not inside:
+                return None
+            uncovered.append(inside)
+
+    size = 0
+    while uncovered:
+        # Pick the candidate in the most uncovered rectangles
+        count = {}
+        for inside in uncovered:
+            for k in inside:
+                count[k] = count.get(k, 0) + 1
+        best = max(count, key=count.get)
+        uncovered = [inside for inside in uncovered if best not in inside]
+        size += 1
+    return size
+
+
+def estimate_work(plan, features, min_size, max_size, max_nb_sol):
+    """
+    Number of subsets enumerated by the plan if the solution has size s = features['estimate'].
+    Increasing: every size up to s.
+    Decreasing: the sizes k > s stop after max_nb_sol solutions. A solution of size s is contained in a fraction
+    comb(m - s, k - s) / comb(m, k) of the subsets of size k, so we count max_nb_sol times the inverse of that fraction.
+    The search then stops at size s, which is enumerated entirely.
+    """
+    engine, direction = plan
+    m, s = features["m"], features["estimate"]
+    if s is None or s > max_size:
+        # No solution in the range: every size is enumerated
+        return sum(comb(m, k) for k in range(min_size, max_size + 1))
+    s = max(s, min_size)
+    if direction == "increasing":
+        return sum(comb(m, k) for k in range(min_size, s + 1))
+    work = comb(m, s)
+    for k in range(s + 1, max_size + 1):
+        work += min(comb(m, k), max_nb_sol * comb(m, k) // comb(m - s, k - s))
+    return work
+
+
+def eligible_plans(N, exact=False):
+    """
+    Plans (engine, direction) that can run an instance with N points.
+    exact := only the plans that are guaranteed to return minimum size solutions (increasing direction)
+    """
+    plans = [("setmask", "increasing")]
+    if N <= 63:
+        plans.append(("bitmask", "increasing"))
+    if find_solutions_cy is not None and N <= 64:
+        plans.append(("bitmask_cy", "increasing"))
+        if not exact:
+            plans.append(("bitmask_cy", "decreasing"))
+    return plans
+
+
+def load_bench():
+    global _bench_records
+    if _bench_records is None:
+        _bench_records = []
+        if os.path.exists(BENCH_FILE):
+            with open(BENCH_FILE, 'r') as f:
+                for line in f:
+                    try:
+                        _bench_records.append(json.loads(line))
+                    except json.JSONDecodeError:   # partially written line
+                        continue
+    return _bench_records
+
+
+def record_run(plan, features, work, duration):
+    record = dict(features, engine=plan[0], direction=plan[1], work=work, time=duration)
+    os.makedirs(os.path.dirname(BENCH_FILE), exist_ok=True)
+    with open(BENCH_FILE, 'a') as f:
+        f.write(json.dumps(record) + "\n")
+    load_bench().append(record)
+
+
+def learned_runs(plan):
+    return [r for r in load_bench() if (r["engine"], r["direction"]) == tuple(plan)
+            and r["work"] > 0 and r["time"] >= MIN_RUN_TIME]
+
+
+def learned_rate(plan, features):
+    """
+    Seconds per modelled subset of the plan: median over the NB_NEIGHBOURS recorded runs of the plan
+    that are the closest to the instance in (N, m, density).
+    """
+    runs = learned_runs(plan)
+    if not runs:
+        return DEFAULT_RATES[tuple(plan)]
+
+    def distance(r):
+        return abs(r["N"] - features["N"]) / 64 + abs(r["m"] - features["m"]) / 64 + abs(r["density"] - features["density"])
+
+    runs.sort(key=distance)
+    return median(r["time"] / r["work"] for r in runs[:NB_NEIGHBOURS])
+
+
+def predicted_time(plan, features, min_size, max_size, max_nb_sol):
+    return estimate_work(plan, features, min_size, min(features["m"], max_size), max_nb_sol) * learned_rate(plan, features)
+
+
+def choose_plan(all_points, n, max_nb_sol=3, min_size=0, max_size=0, exact=False, time_limit=TIME_LIMIT):
+    """
+    Returns the plan (engine, direction) with the smallest predicted time, together with the instance features.
+    A plan with few recorded runs is returned instead if it is predicted at most EXPLORE_FACTOR times slower
+    (and under time_limit).
+    """
+    features = instance_features(all_points, n)
+    predicted = {plan: predicted_time(plan, features, min_size, max_size, max_nb_sol)
+                 for plan in eligible_plans(features["N"], exact)}
+    best = min(predicted, key=predicted.get)
+
+    unexplored = [plan for plan in predicted if len(learned_runs(plan)) < NB_NEIGHBOURS
+                  and predicted[plan] <= min(EXPLORE_FACTOR * predicted[best], time_limit)]
+    if unexplored:
+        return min(unexplored, key=predicted.get), features
+    return best, features
+
+
+def run_plan(plan, all_points, n, max_nb_sol=3, min_size=0, max_size=0):
+    engine, direction = plan
+    if engine == "bitmask_cy":
+        if direction == "decreasing":
+            return find_solutions_reverse_cy(all_points, n, max_nb_sol=max_nb_sol, min_size=min_size, max_size=max_size)
+        return find_solutions_cy(all_points, n, max_nb_sol=max_nb_sol, min_size=min_size, max_size=max_size)
+
+    if engine == "bitmask":
+        found, mask_list = find_solutions_mask(all_points, n, max_nb_sol, min_size=min_size, max_size=max_size)
+        solutions = [[all_points[i] for i in range(len(all_points)) if mask & (1 << i)] for mask in mask_list if mask]
+        return found, solutions
+
+    found, solutions = find_solutions_set(all_points, n, max_nb_sol, min_size=min_size, max_size=max_size)
+    return found, solutions[:max_nb_sol]
+
+
+def solve(all_points, n, max_nb_sol=3, min_size=0, max_size=0, exact=False, plan=None, record=True, time_limit=TIME_LIMIT):
+    """
+    Single entry point to the engines: same arguments and return value as bitmask_cy.find_solutions.
+    all_points  := list of N points, the first n are the input points
+    exact       := only use the plans that return minimum size solutions
+    plan        := (engine, direction) to run, chosen by choose_plan if None
+    record      := append the run to BENCH_FILE so that the following choices learn from it
+    time_limit  := raises ValueError instead of running the plan if its predicted time is longer (None: no limit)
+
+    The predicted time is usually an underestimate (see estimate_size), the limit only refuses the hopeless instances.
+    """
+    all_points = list(all_points)
+    if plan is None:
+        plan, features = choose_plan(all_points, n, max_nb_sol, min_size, max_size, exact,
+                                     time_limit=float('inf') if time_limit is None else time_limit)
+    else:
+        features = instance_features(all_points, n)
+
+    if features["estimate"] is None:
+        print("Some input pair has no candidate in its rectangle: no solution")
+        return False, []
+
+    predicted = predicted_time(plan, features, min_size, max_size, max_nb_sol)
+    if time_limit is not None and predicted > time_limit:
+        raise ValueError(f"{plan[1].capitalize()} search with {plan[0]} predicted to take {predicted:.3g} sec "
+                         f"(N={features['N']}, m={features['m']}, estimated size={features['estimate']}), "
+                         f"more than {time_limit} sec: lower the max size or remove candidate points.")
+
+    print(f"{plan[1].upper()} SEARCH with {plan[0]} (N={features['N']}, m={features['m']}, estimated size={features['estimate']})")
+    t1 = time.time()
+    found, solutions = run_plan(plan, all_points, n, max_nb_sol, min_size, max_size)
+    t2 = time.time()
+
+    if record:
+        work = estimate_work(plan, features, min_size, min(features["m"], max_size), max_nb_sol)
+        record_run(plan, features, work, t2 - t1)
+    return found, solutions
+
+
+def benchmark(all_points, n, max_nb_sol=3, min_size=0, max_size=0, time_limit=BENCH_TIME_LIMIT):
+    """
+    Runs every eligible plan on the instance and records the timings (seeds the learned rates).
+    The plans predicted to take longer than time_limit are skipped.
+    """
+    all_points = list(all_points)
+    for plan in eligible_plans(len(all_points)):
+        try:
+            solve(all_points, n, max_nb_sol, min_size, max_size, plan=plan, time_limit=time_limit)
+        except ValueError as e:
+            print(f"Skipped: {e}")
+
+
+if __name__ == "__main__":
+    # Benchmark every archived instance: python dispatch.py
+    from archive import Archive, mask_to_points
+    for record_id, timestamp, rows, cols, input_mask, candidate_mask, solution_masks in Archive().scan():
+        input_pts = mask_to_points(input_mask, cols)
+        candidates = mask_to_points(candidate_mask, cols)
+        # No need to search past the size of the archived solutions
+        max_size = min((bin(mask).count('1') for mask in solution_masks), default=len(candidates))
+        print(f"Benchmarking instance {record_id}")
+        benchmark(input_pts + candidates, len(input_pts), max_size=max_size)
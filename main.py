@@ -1,25 +1,26 @@
 import streamlit as st
 import time
-import json
-import glob
-import os
 # import logging
 import logging.config
 import sys
 # from setmask import find_solutions
 # from bitmask import find_solutions_mask
-from bitmask_cy import find_solutions, find_solutions_reverse
+# from bitmask_cy import find_solutions, find_solutions_reverse
+from dispatch import solve
+from service import request_solve, ServiceError
+from archive import Archive, ARCHIVE_PATH, parse_timestamp
 
 
 # Default values
 GRID_ROWS = 10
 GRID_COLS = 8
 DISPLAY = True
+SOLS_PER_PAGE = 5
 # For the search:
 MAX_NB_SOLS = 2
 MIN_SIZE = 0
 MAX_SIZE = 15
-HEURISTIC = True # if False, then in increasing order
+EXACT = False # if True, only search in increasing order (the engine and direction are picked by dispatch.solve)
 
 # Button appearance mapping using emoji squares
 EMOJI_MAP = {
@@ -43,6 +44,15 @@ st.markdown(
         background: transparent;
         line-height: 1;
     }
+    table.solution {
+        border-collapse: collapse;
+        line-height: 1;
+    }
+    table.solution td {
+        padding: 0;
+        border: 0;
+        text-align: center;
+    }
     </style>
     """,
     unsafe_allow_html=True,
@@ -110,14 +120,19 @@ def is_manhattan_connected(points):
                 return False
     return True
 
-def search(all_points, n, decr=True):
+def search(all_points, n, exact=False):
     t1 = time.time()
-    if decr:
-        print("DECREASING SEARCH")
-        found, solutions = find_solutions_reverse(all_points, n, max_nb_sol=st.session_state.max_nb_sol, min_size=st.session_state.min_size, max_size=st.session_state.max_size)
-    else:
-        print("INCREASING SEARCH")
-        found, solutions = find_solutions(all_points, n, max_nb_sol=st.session_state.max_nb_sol, min_size=st.session_state.min_size, max_size=st.session_state.max_size)       
+    try:
+        try:
+            # Shared solver service (python service.py)
+            found, solutions = request_solve(all_points, n, max_nb_sol=st.session_state.max_nb_sol, min_size=st.session_state.min_size, max_size=st.session_state.max_size, exact=exact)
+        except OSError:
+            print("Solver service not running, solving in this session")
+            found, solutions = solve(all_points, n, max_nb_sol=st.session_state.max_nb_sol, min_size=st.session_state.min_size, max_size=st.session_state.max_size, exact=exact)
+    except (ServiceError, ValueError) as e:
+        # Not solved again in the session: the instance timed out, crashed a worker or is predicted to be too long
+        st.error(str(e))
+        return
     t2 = time.time()
     nb_sol = len(solutions)
 
@@ -139,23 +154,47 @@ def input_points(grid):
 def candidate_points(grid):
     return [(i, j) for i, row in enumerate(grid) for j, v in enumerate(row) if v == 2]
 
+def solution_html(solution, input_set, candidate_set):
+    """
+    The grid of one solution as a single HTML table (instead of one button per cell).
+
+    Complexity: O(rows * cols) with set lookups
+    """
+    solution_set = {tuple(p) for p in solution}
+    rows = []
+    for i in range(st.session_state.grid_rows):
+        cells = []
+        for j in range(st.session_state.grid_cols):
+            if (i, j) in input_set:
+                symbol = EMOJI_MAP[1]
+            elif (i, j) in solution_set:
+                symbol = EMOJI_MAP[3]
+            elif (i, j) in candidate_set:
+                symbol = EMOJI_MAP[2]
+            else:
+                symbol = EMOJI_MAP[0]
+            cells.append(f"<td>{symbol}</td>")
+        rows.append(f"<tr>{''.join(cells)}</tr>")
+    return f"<table class='solution'>{''.join(rows)}</table>"
+
 def display_solutions():
-    for x, solution in enumerate(st.session_state.solutions):
-        st.write(f"Solution {x+1}:")
-        for i in range(st.session_state.grid_rows):
-            cols = st.columns(st.session_state.grid_cols)
-            for j in range(st.session_state.grid_cols):
-                if (i, j) in st.session_state.input:
-                    symbol = EMOJI_MAP[1]
-                elif [i, j] in solution or (i, j) in solution:
-                    symbol = EMOJI_MAP[3]
-                elif (i, j) in st.session_state.candidates:
-                    symbol = EMOJI_MAP[2]
-                else:
-                    symbol = EMOJI_MAP[0]
-                cols[j].button(symbol, key=f"{i}-{j}_{x}", args=(i, j, x))
-    if not st.session_state.solutions:
+    solutions = st.session_state.solutions
+    if not solutions:
         st.write("No solution found")
+        return
+
+    # Only the solutions of the current page are rendered
+    nb_pages = (len(solutions) + SOLS_PER_PAGE - 1) // SOLS_PER_PAGE
+    page = 1
+    if nb_pages > 1:
+        page = st.number_input(f"Solutions page (out of {nb_pages})", min_value=1, max_value=nb_pages, value=1, key="solutions_page")
+    first = (page - 1) * SOLS_PER_PAGE
+
+    input_set = set(st.session_state.input)
+    candidate_set = set(st.session_state.candidates)
+    for x in range(first, min(first + SOLS_PER_PAGE, len(solutions))):
+        with st.expander(f"Solution {x+1}:", expanded=(x == first)):
+            st.markdown(solution_html(solutions[x], input_set, candidate_set), unsafe_allow_html=True)
 
 def cycle_cell(i, j):
     # updates the grid value when clicking
@@ -173,32 +212,38 @@ def init_grid():
     st.session_state.grid = [[0 for _ in range(st.session_state.grid_cols)] for _ in range(st.session_state.grid_rows)]
     init_grid_pty()
 
-def load_instance(instance_name):
-    with open(instance_name, 'r') as f:
-        data_loaded = json.load(f)
-        st.session_state.grid_rows = data_loaded['GRID_ROWS']
-        st.session_state.grid_cols = data_loaded['GRID_COLS']
-
-        st.session_state.grid = [[0 for _ in range(st.session_state.grid_cols)] for _ in range(st.session_state.grid_rows)]
-        st.session_state.grid = data_loaded['grid']
-        
-        init_grid_pty()
-        if 'solutions' in data_loaded:
-            st.session_state.solutions = data_loaded['solutions']
-    f.close()
-    print(f"Loaded instance {instance_name}")
+def load_instance(data_loaded):
+    st.session_state.grid_rows = data_loaded['GRID_ROWS']
+    st.session_state.grid_cols = data_loaded['GRID_COLS']
+    st.session_state.grid = data_loaded['grid']
+
+    init_grid_pty()
+    if 'solutions' in data_loaded:
+        st.session_state.solutions = data_loaded['solutions']
+    print(f"Loaded instance {data_loaded['id']} ({time.strftime('%Y%m%d-%H%M%S', time.localtime(data_loaded['timestamp']))})")
 
 def load_latest():
-    list_of_files = glob.glob('./json/*.json') 
-    if len(list_of_files):
-        # Load latest instance
-        latest_file = max(list_of_files, key=os.path.getctime)
-        load_instance(latest_file)
+    latest = Archive(ARCHIVE_PATH).latest()
+    if latest is not None:
+        load_instance(latest)
     else:
         st.write("No latest instance")
 
 def load_file():
-    load_instance(f'./json/{st.session_state.loaded_filename}.json')
+    # Instance id, or timestamp in the format of the old json filenames (e.g. 20260120-134002)
+    name = st.session_state.loaded_filename.strip()
+    archive = Archive(ARCHIVE_PATH)
+    if name.isdigit() and int(name) < len(archive):
+        record_id = int(name)
+    else:
+        try:
+            record_id = archive.find(parse_timestamp(name))
+        except ValueError:
+            record_id = None
+    if record_id is None:
+        st.write(f"No instance {name}")
+    else:
+        load_instance(archive.get(record_id))
 
 def solver():
 
@@ -215,31 +260,21 @@ def solver():
         all_points = st.session_state.input + st.session_state.candidates
         n = len(st.session_state.input)
 
-        filename = time.strftime("%Y%m%d-%H%M%S")
-        save(filename)
-        search(all_points, n, HEURISTIC)
-        save(filename)
+        search(all_points, n, EXACT)
+        save()
 
 
-def save(filename):
-    instance = {
-        'GRID_ROWS': st.session_state.grid_rows,
-        'GRID_COLS': st.session_state.grid_cols,
-        'grid': st.session_state.grid,
-        'solutions': st.session_state.solutions
-    }
-    with open(f'./json/{filename}.json', 'w') as f:    
-        json.dump(instance, f)
-    f.close()  
-    print(f"Saved in {filename}")
+def save():
+    record_id = Archive(ARCHIVE_PATH).append(st.session_state.grid_rows, st.session_state.grid_cols, st.session_state.grid, st.session_state.solutions)
+    print(f"Saved as instance {record_id}")
 
 
 
 #### PAGE LAYOUT
 
 st.title("Is this Mannhattan Connected?")
-if HEURISTIC:
-    st.info("The 'Solve' button doesn\'t find the min for sure. It starts by taking subsets of red points of max size, and decreases the size with the rule that if it finds more than max number of solutions, then it decreases the size, otherwise if it finds exactly the number of solutions entered (exhaustive search), then it stops and displays the found solutions.")
+if not EXACT:
+    st.info("The 'Solve' button picks the fastest engine for the instance. When it searches in decreasing order, it doesn\'t find the min for sure. It starts by taking subsets of red points of max size, and decreases the size with the rule that if it finds more than max number of solutions, then it decreases the size, otherwise if it finds exactly the number of solutions entered (exhaustive search), then it stops and displays the found solutions.")
 
 col1, col2, col3 = st.columns(3)
 with col1:
@@ -247,7 +282,7 @@ with col1:
     col_size = st.slider("Number of columns", 1, 20, GRID_COLS, key="col_slider", on_change=init_grid)
     st.button("Clear", type="primary", on_click=init_grid)
 with col2:
-    st.text_input("Instance to load:", "Enter json filename", key="loaded_filename", on_change=load_file)
+    st.text_input("Instance to load:", "Enter instance id or timestamp", key="loaded_filename", on_change=load_file)
     st.button("Load latest instance", type="primary", on_click=load_latest)
 with col3:
     st.number_input("Min solution size", value=MIN_SIZE, key="min_size")
@@ -0,0 +1,312 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from itertools import count
+from queue import Empty, PriorityQueue
+
+#####################
+# SOLVER SERVICE:
+# Long-lived process shared by all the streamlit sessions, launched with `python service.py`.
+# main.py sends its instances over a Unix domain socket, and falls back to solving in-process when the service is not running.
+#
+# PROTOCOL: every message is a 4-byte big-endian length followed by a JSON object.
+#   request  := {"points": [[x, y], ...], "n": n, "max_nb_sol": .., "min_size": .., "max_size": .., "exact": .., "priority": ..}
+#               the first n points are the input points, a lower priority is served first
+#   response := {"found": bool, "solutions": [[[x, y], ...], ...], "cached": bool} or {"error": message}
+#
+# Instances are canonicalized before solving (translated to the origin, input and candidate points sorted) so that
+# the same instance drawn at another place of the grid, or clicked in another order, hits the same cache entry.
+# Results are kept in an LRU cache, and identical requests arriving while an instance is solved wait for the same result.
+# A running solve can't be stopped without breaking the whole pool: when a client times out, the solve goes on (and its result
+# is cached), but identical requests are refused until it is done, so one slow instance never takes more than one worker.
+#####################
+
+SOCKET_PATH = '/tmp/manhattan_solver.sock'
+NB_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+CACHE_SIZE = 1024
+TIMEOUT = 600           # seconds a client waits for an answer
+
+_HEADER = struct.Struct('>I')
+
+
+class ServiceError(RuntimeError):
+    """
+    Error reported by the service (failed or timed out solve, crashed worker).
+    """
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode()
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock):
+    header = _recv_exactly(sock, _HEADER.size)
+    (length,) = _HEADER.unpack(header)
+    return json.loads(_recv_exactly(sock, length))
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Connection closed in the middle of a message")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def canonicalize(points, n):
+    """
+    Translates the points so that the bounding box starts at (0, 0), and sorts the input and the candidate points.
+    Manhattan connectivity is invariant under translation and doesn't depend on the order of the points.
+
+    Returns the canonical list of points and the offset to add to the solutions.
+    """
+    points = [tuple(p) for p in points]
+    if not points:
+        return [], (0, 0)
+    dx = min(p[0] for p in points)
+    dy = min(p[1] for p in points)
+    shifted = [(x - dx, y - dy) for x, y in points]
+    return sorted(shifted[:n]) + sorted(shifted[n:]), (dx, dy)
+
+
+#######################################
+# Worker processes
+
+def _warm_up():
+    # Import the engines (and load the Cython extension) once per worker, not on the first request
+    from dispatch import solve
+    solve([(0, 0), (1, 1), (1, 0)], 2, max_nb_sol=1, max_size=1, record=False)
+
+
+def _solve(points, n, max_nb_sol, min_size, max_size, exact):
+    from dispatch import solve
+    return solve(points, n, max_nb_sol=max_nb_sol, min_size=min_size, max_size=max_size, exact=exact)
+
+
+#######################################
+# Server
+
+class SolverService:
+    """
+    Result cache, request queue (by priority then arrival order) and pool of NB_WORKERS warm worker processes.
+    """
+
+    def __init__(self, nb_workers=NB_WORKERS, cache_size=CACHE_SIZE):
+        self.nb_workers = nb_workers
+        self.pool = ProcessPoolExecutor(max_workers=nb_workers, initializer=_warm_up)
+        self.cache = OrderedDict()      # key -> (found, solutions), in canonical coordinates
+        self.cache_size = cache_size
+        self.pending = {}               # key -> Future of the instance being solved or queued
+        self.running = {}               # key -> Future of the instance being solved by a worker
+        self.expired = set()            # keys of the running instances whose client timed out
+        self.queue = PriorityQueue()
+        self.slots = threading.Semaphore(nb_workers)
+        self.lock = threading.Lock()
+        self.arrival = count()
+        threading.Thread(target=self._schedule, daemon=True).start()
+
+    def submit(self, request):
+        """
+        Returns (key, Future of (found, solutions) in canonical coordinates, offset, cached).
+        """
+        n = request["n"]
+        points, offset = canonicalize(request["points"], n)
+        params = (request.get("max_nb_sol", 3), request.get("min_size", 0), request.get("max_size", 0), request.get("exact", False))
+        key = json.dumps([points, n, params])
+
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                future = Future()
+                future.set_result(self.cache[key])
+                return key, future, offset, True
+            if key in self.expired:
+                raise ServiceError("An identical request timed out and is still being solved, "
+                                   "try again later (its result will be cached).")
+            if key in self.pending:
+                return key, self.pending[key], offset, False
+
+            future = Future()
+            self.pending[key] = future
+        self.queue.put((request.get("priority", 0), next(self.arrival), key, (points, n) + params))
+        return key, future, offset, False
+
+    def solve(self, request, timeout=TIMEOUT):
+        """
+        Returns (found, solutions, cached) for the request, solutions in the coordinates of the request.
+        """
+        key, future, (dx, dy), cached = self.submit(request)
+        try:
+            found, solutions = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if self._expire(key, future):
+                raise ServiceError(f"No result after {timeout} sec. The instance is still being solved by a worker and "
+                                   f"identical requests are refused until it is done (its result will then be cached).")
+            raise ServiceError(f"No result after {timeout} sec, the request was dropped from the queue.")
+        return found, [[(x + dx, y + dy) for x, y in solution] for solution in solutions], cached
+
+    def _schedule(self):
+        # Never stops: a failure only fails the request being scheduled
+        while True:
+            self.slots.acquire()
+            _, _, key, args = self.queue.get()
+            with self.lock:
+                if key not in self.pending or key in self.running:
+                    # Timed out while queued, or already solved by a previous identical request
+                    self.slots.release()
+                    continue
+                self.running[key] = self.pending[key]
+            pool = self.pool
+            try:
+                job = pool.submit(_solve, *args)
+            except Exception as e:
+                self.slots.release()
+                self._fail(key, e)
+                if isinstance(e, BrokenProcessPool):
+                    self._restart_pool(pool)
+                continue
+            job.add_done_callback(lambda job, key=key, pool=pool: self._done(key, job, pool))
+
+    def _done(self, key, job, pool):
+        self.slots.release()
+        error = CancelledError() if job.cancelled() else job.exception()
+        if error is not None:
+            self._fail(key, error)
+            if isinstance(error, BrokenProcessPool):
+                self._restart_pool(pool)
+            return
+
+        with self.lock:
+            future = self._take(key)
+            self.cache[key] = job.result()
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        if future is not None:
+            future.set_result(job.result())
+
+    def _fail(self, key, error):
+        with self.lock:
+            future = self._take(key)
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    def _take(self, key):
+        # Forgets the request key (queued, running or expired) and returns its Future. Called with self.lock held.
+        self.expired.discard(key)
+        future = self.running.pop(key, None)
+        if future is None:
+            return self.pending.pop(key, None)
+        if self.pending.get(key) is future:
+            del self.pending[key]
+        return future
+
+    def _expire(self, key, future):
+        """
+        Called when a client timed out waiting for future: new identical requests must not wait on it.
+        A queued request is dropped, a running one goes on but identical requests are refused until it is done.
+        Returns whether the request is running.
+        """
+        with self.lock:
+            if self.running.get(key) is future:
+                self.expired.add(key)
+                self.pending.pop(key, None)
+                return True
+            if self.pending.get(key) is not future:     # done in the meantime, or already dropped
+                return False
+            del self.pending[key]
+        future.set_exception(ServiceError("Dropped from the queue after a timeout"))
+        return False
+
+    def _restart_pool(self, broken_pool):
+        """
+        Replaces the pool after a worker process died (e.g. a crash in the Cython engine) and fails the queued requests.
+        """
+        with self.lock:
+            if self.pool is not broken_pool:    # already restarted by another failed request
+                return
+            self.pool = ProcessPoolExecutor(max_workers=self.nb_workers, initializer=_warm_up)
+        broken_pool.shutdown(wait=False, cancel_futures=True)
+        print("A worker process died, restarted the pool")
+        while True:
+            try:
+                _, _, key, _ = self.queue.get_nowait()
+            except Empty:
+                break
+            self._fail(key, BrokenProcessPool("A worker process died, the request was dropped"))
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        try:
+            request = recv_message(self.request)
+            found, solutions, cached = self.server.service.solve(request)
+            response = {"found": bool(found), "solutions": solutions, "cached": cached}
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        send_message(self.request, response)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path=SOCKET_PATH, nb_workers=NB_WORKERS):
+    if os.path.exists(socket_path):     # left by a previous run
+        os.unlink(socket_path)
+    service = SolverService(nb_workers)
+    with _Server(socket_path, _RequestHandler) as server:
+        server.service = service
+        print(f"Solver service listening on {socket_path} with {nb_workers} workers")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.shutdown()
+            os.unlink(socket_path)
+
+
+#######################################
+# Client
+
+def request_solve(all_points, n, max_nb_sol=3, min_size=0, max_size=0, exact=False, priority=0, socket_path=SOCKET_PATH):
+    """
+    Same arguments and return value as dispatch.solve, solved by the service.
+    Raises OSError if the service is not running, ServiceError if it failed to solve the instance.
+    """
+    request = {
+        "points": [list(p) for p in all_points],
+        "n": n,
+        "max_nb_sol": max_nb_sol,
+        "min_size": min_size,
+        "max_size": max_size,
+        "exact": exact,
+        "priority": priority,
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        send_message(sock, request)
+        response = recv_message(sock)
+    if "error" in response:
+        raise ServiceError(f"Solver service: {response['error']}")
+    if response["cached"]:
+        print("Solution from the service cache")
+    return response["found"], [[tuple(p) for p in solution] for solution in response["solutions"]]
+
+
+if __name__ == "__main__":
+    serve()
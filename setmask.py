@@ -59,12 +59,16 @@ def is_manhattan_connected(points):
     M, aligned = build_masks(points)
     return is_valid(POINTS_MASK, 0, M, aligned)
 
-def find_solutions(all_points, n, max_nb_sol):
-    if is_manhattan_connected(all_points[:n]):
+def find_solutions(all_points, n, max_nb_sol, min_size=0, max_size=None):
+    """
+    Solutions with size in [min_size, max_size] (max_size=None means m), in increasing size.
+    """
+    if min_size <= 0 and is_manhattan_connected(all_points[:n]):
         return True, list()
     
     N = len(all_points)
     m = N - n
+    max_size = m if max_size is None else min(m, max_size)
 
     INPUT_MASK = set(range(n))
     CANDIDATE_MASK = range(n, N)
@@ -74,7 +78,7 @@ def find_solutions(all_points, n, max_nb_sol):
 
     # Iterate over every subset of size k of candidate points
     list_solutions = list()
-    for size in range(1, m+1):
+    for size in range(max(1, min_size), max_size+1):
         found_solution = False
         for subset in combinations(CANDIDATE_MASK, size): 
             SUBSET_MASK = INPUT_MASK | set(subset)
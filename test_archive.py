@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import tempfile
+from archive import Archive, INDEX_ENTRY, encode_record, decode_record, convert_json
+
+JSON_EXAMPLE = './json/20260120-134002.json'
+
+
+def small_instance(k):
+    # 3x3 grid with the input points (0, 0) and (2, 2), candidate (k % 3, 1)
+    grid = [[0, 0, 0], [0, 0, 0], [0, 0, 0]]
+    grid[0][0] = grid[2][2] = 1
+    grid[k % 3][1] = 2
+    return 3, 3, grid, [[(k % 3, 1)]]
+
+
+def same_instance(instance, rows, cols, grid, solutions):
+    return (instance['GRID_ROWS'], instance['GRID_COLS'], instance['grid']) == (rows, cols, grid) \
+        and sorted(sorted(map(tuple, s)) for s in instance['solutions']) == sorted(sorted(map(tuple, s)) for s in solutions)
+
+
+def run_round_trip_test():
+    with open(JSON_EXAMPLE, 'r') as f:
+        data_loaded = json.load(f)
+    record = encode_record(data_loaded['GRID_ROWS'], data_loaded['GRID_COLS'], data_loaded['grid'], data_loaded['solutions'])
+    assert same_instance(decode_record(record), data_loaded['GRID_ROWS'], data_loaded['GRID_COLS'], data_loaded['grid'], data_loaded['solutions'])
+    print(f"Round trip OK ({len(record)} bytes instead of {os.path.getsize(JSON_EXAMPLE)})")
+
+
+def run_append_test(path):
+    archive = Archive(path)
+    assert len(archive) == 0 and archive.latest() is None
+    for k in range(3):
+        assert archive.append(*small_instance(k), timestamp=100 + 10 * k) == k
+
+    assert len(archive) == 3
+    assert same_instance(archive.get(1), *small_instance(1))
+    assert archive.get(-1)['id'] == 2 and archive.latest()['timestamp'] == 120
+    assert archive.find(110) == 1 and archive.find(115) is None
+
+    scanned = list(archive.scan(1))
+    assert [record[:2] for record in scanned] == [(1, 110), (2, 120)]
+    _, _, rows, cols, input_mask, candidate_mask, solution_masks = scanned[0]
+    assert (rows, cols, input_mask, candidate_mask, solution_masks) == (3, 3, 1 | 1 << 8, 1 << 4, [1 << 4])
+
+    try:
+        archive.append(*small_instance(0), timestamp=50)
+    except ValueError:
+        pass
+    else:
+        assert False, "expected a ValueError for an older timestamp"
+    print("Append OK")
+
+
+def run_merge_test(path):
+    archive = Archive(path)
+    archive.merge([(115, *small_instance(5)), (90, *small_instance(9)), (110, *small_instance(11))])
+    timestamps = [record[1] for record in archive.scan()]
+    assert timestamps == [90, 100, 110, 110, 115, 120], timestamps
+    assert [record[0] for record in archive.scan()] == list(range(6))
+    # Existing records first among equal timestamps
+    assert same_instance(archive.get(2), *small_instance(1))
+    assert same_instance(archive.get(3), *small_instance(11))
+    assert archive.find(110) == 2
+    print("Merge OK")
+
+
+def run_truncated_index_test(path):
+    archive = Archive(path)
+    nb_records = len(archive)
+    with open(archive.index_path, 'ab') as index:
+        index.write(INDEX_ENTRY.pack(200, 0, 0)[:5])     # interrupted append
+    with open(archive.data_path, 'ab') as data:
+        data.write(b'garbage')
+    assert len(archive) == nb_records
+
+    assert archive.append(*small_instance(2), timestamp=200) == nb_records
+    assert os.path.getsize(archive.index_path) == 8 + (nb_records + 1) * INDEX_ENTRY.size
+    assert same_instance(archive.get(-1), *small_instance(2))
+    assert same_instance(archive.get(0), *small_instance(9))
+    print("Truncated index OK")
+
+
+def run_convert_test(tmp_dir):
+    json_dir = os.path.join(tmp_dir, 'json')
+    os.makedirs(json_dir)
+    shutil.copy(JSON_EXAMPLE, json_dir)
+    with open(os.path.join(json_dir, '20260101-000000.json'), 'w') as f:
+        json.dump({"GRID_ROWS": 2}, f)       # not an instance
+    with open(os.path.join(json_dir, '20260102-000000.json'), 'w') as f:
+        f.write('{"GRID_ROWS": 2, "GRI')     # interrupted write
+
+    path = os.path.join(tmp_dir, 'converted')
+    assert convert_json(json_dir, path) == 1
+    assert convert_json(json_dir, path) == 0
+    assert len(Archive(path)) == 1
+    print("Convert OK")
+
+
+# run all tests:
+
+run_round_trip_test()
+with tempfile.TemporaryDirectory() as tmp_dir:
+    path = os.path.join(tmp_dir, 'instances')
+    run_append_test(path)
+    run_merge_test(path)
+    run_truncated_index_test(path)
+    run_convert_test(tmp_dir)
@@ -0,0 +1,42 @@
+from dispatch import estimate_size, estimate_work, solve
+
+
+def run_estimate_size_test():
+    # No candidate in the rectangle of (0, 0) and (1, 1): no subset can connect them
+    assert estimate_size([(0, 0), (1, 1)], 2) is None
+    # Aligned input points are already connected
+    assert estimate_size([(0, 0), (0, 3), (2, 3)], 3) == 0
+    # One candidate per unconnected pair
+    assert estimate_size([(0, 0), (1, 1), (1, 0), (0, 1)], 2) == 1
+    print("estimate_size OK")
+
+
+def run_estimate_work_test():
+    features = {"N": 6, "m": 4, "density": 1.0, "estimate": 2}
+    # Increasing: every subset of size 0, 1 and 2
+    assert estimate_work(("bitmask_cy", "increasing"), features, 0, 4, 1) == 1 + 4 + 6
+    # Decreasing: size 4 and 3 stop at the first solution (1 and 4 // 2 subsets), size 2 is enumerated
+    assert estimate_work(("bitmask_cy", "decreasing"), features, 0, 4, 1) == 1 + 2 + 6
+    # No solution: every size of the range
+    features["estimate"] = None
+    assert estimate_work(("bitmask_cy", "decreasing"), features, 1, 3, 1) == 4 + 6 + 4
+    print("estimate_work OK")
+
+
+def run_time_limit_test():
+    # Refused instead of running when the predicted time is over the limit
+    try:
+        solve([(0, 0), (1, 1), (1, 0)], 2, max_size=1, plan=("setmask", "increasing"), record=False, time_limit=0)
+    except ValueError as e:
+        print(f"Refused: {e}")
+    else:
+        assert False, "expected a ValueError"
+    assert solve([(0, 0), (1, 1), (1, 0)], 2, max_size=1, plan=("setmask", "increasing"), record=False) == (True, [[(1, 0)]])
+    print("time limit OK")
+
+
+# run all tests:
+
+run_estimate_size_test()
+run_estimate_work_test()
+run_time_limit_test()
@@ -0,0 +1,27 @@
+from service import canonicalize
+
+
+def run_canonicalize_test():
+    input_points = [(2, 3), (3, 4)]
+    candidate_points = [(3, 3), (2, 4)]
+    points, offset = canonicalize(input_points + candidate_points, 2)
+    assert points == [(0, 0), (1, 1), (0, 1), (1, 0)], points
+    assert offset == (2, 3), offset
+
+    # Same instance translated, with the input and candidate points clicked in another order: same key
+    moved_input = [(13, 14), (12, 13)]
+    moved_candidates = [(12, 14), (13, 13)]
+    moved_points, moved_offset = canonicalize(moved_input + moved_candidates, 2)
+    assert moved_points == points, moved_points
+    assert moved_offset == (12, 13), moved_offset
+
+    # The offset maps a solution found on the canonical points back to the instance
+    dx, dy = moved_offset
+    assert [(x + dx, y + dy) for x, y in [points[3]]] == [(13, 13)]
+    assert canonicalize([], 0) == ([], (0, 0))
+    print("canonicalize OK")
+
+
+# run all tests:
+
+run_canonicalize_test()
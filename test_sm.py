@@ -1,4 +1,5 @@
 from setmask import build_masks, is_valid, find_solutions
+import bitmask_cy
 import time 
 
 
@@ -99,6 +100,26 @@ def run_test(all_points, n, N, expected):
     return 
 
 
+def run_differential_test(all_points, n, N, expected):
+    """
+    The Cython engine (increasing search) must find the same minimum solutions as the set implementation,
+    and the decreasing search only solutions that connect the input.
+    """
+    found_sm, sols_sm = find_solutions(all_points, n, 1000)
+    found_cy, sols_cy = bitmask_cy.find_solutions(all_points, n, max_nb_sol=1000, min_size=0, max_size=N - n)
+    assert found_sm == found_cy, (found_sm, found_cy)
+    assert {frozenset(s) for s in sols_sm} == {frozenset(s) for s in sols_cy}, (sols_sm, sols_cy)
+
+    found_rev, sols_rev = bitmask_cy.find_solutions_reverse(all_points, n, max_nb_sol=3, min_size=0, max_size=N - n)
+    INPUT_MASK = set(range(n))
+    valid, aligned = build_masks(all_points)
+    for s in sols_rev:
+        assert is_valid(INPUT_MASK | {all_points.index(p) for p in s}, N, valid, aligned), s
+        if sols_sm:
+            assert len(s) >= len(sols_sm[0]), s
+    print(f"Differential test OK ({len(sols_sm)} solutions)")
+
+
 # run all tests:
 
 run_test(*example_1())
@@ -106,4 +127,8 @@ run_test(*example_2())
 run_test(*example_3())
 run_test(*example_4())
 run_test(*example_5())
+
+for example in (example_1, example_2, example_3, example_4, example_5):
+    run_differential_test(*example())
+
 run_test(*example_6())
\ No newline at end of file